@@ -1,15 +1,21 @@
-from typing import Generator, Iterator, Tuple
+import os
+from collections import deque
+from typing import Any, Iterator, Optional, Tuple, Type, Union
 
+import numba
 import numpy as np
 import numpy.typing as npt
-import pandas as pd
+import pyarrow as pa
 import scipy.sparse as sparse
 import tiledbsoma as soma
 from typing_extensions import Literal
 
-from ._eager_iter import _EagerIterator
+from ._eager_iter import _EagerBufferedIterator, _EagerMapIterator
+
+_SOMA_TBL_COLUMNS = ("soma_data", "soma_dim_0", "soma_dim_1")
 
 _RT = Tuple[Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]], sparse.spmatrix]
+_COO_CHUNK = Tuple[Tuple[npt.NDArray[np.int64], npt.NDArray[np.int64]], Tuple[npt.NDArray[Any], ...]]
 
 
 def X_sparse_iter(
@@ -19,6 +25,7 @@ def X_sparse_iter(
     stride: int = 2**16,
     fmt: Literal["csr", "csc"] = "csr",
     use_eager_fetch: bool = True,
+    data_dtype: Optional[npt.DTypeLike] = None,
 ) -> Iterator[_RT]:
     """
     Return an iterator over an X SparseNdMatrix, returning for each iteration step:
@@ -27,7 +34,8 @@ def X_sparse_iter(
         * X contents as a SciPy csr_matrix or csc_matrix
     The coordinates and X matrix chunks are indexed positionally, i.e. for any
     given value in the matrix, X[i, j], the original soma_joinid (aka soma_dim_0
-    and soma_dim_1) are present in obs_coords[i] and var_coords[j].
+    and soma_dim_1) are present in obs_coords[i] and var_coords[j]. Chunks are
+    returned in ascending obs soma_joinid order.
 
     Args:
         query:
@@ -46,6 +54,10 @@ def X_sparse_iter(
             If true, will use multiple threads to parallelize reading
             and processing. This will improve speed, but at the cost
             of some additional memory use.
+        data_dtype:
+            The dtype of the returned matrices' data. Defaults to the dtype of the X layer
+            (``float32`` for the Census). Values are cast as the matrix is built, so a narrower
+            dtype, e.g. ``uint16`` for raw counts, also reduces the memory traffic of the build.
 
     Returns:
         An iterator which iterates over a tuple of:
@@ -77,52 +89,192 @@ def X_sparse_iter(
     if axis != 0:
         raise ValueError("axis must be zero (obs)")
 
-    # Lazy partition array by chunk_size on first dimension
+    # Lazy partition array by chunk_size on first dimension. obs_coords are sorted (they
+    # usually already are), so that each chunk can be reindexed with a binary search.
+    # Each chunk is a numpy view, used for reindexing and returned to the caller. It is
+    # wrapped (zero-copy) as an Arrow array for the read, which SOMA accepts without the
+    # element-wise conversion applied to numpy coordinates. Arrow slices are not used, as
+    # SOMA ignores the slice offset.
     obs_coords = query.obs_joinids().to_numpy()
+    if not _is_sorted(obs_coords):
+        obs_coords = np.sort(obs_coords)
     obs_coord_chunker = (obs_coords[i : i + stride] for i in range(0, len(obs_coords), stride))
 
-    # Lazy read into Arrow Table. Yields (coords, Arrow.Table)
+    # With a single chunk there is nothing to overlap, so the eager pipeline would only add
+    # thread hand-offs.
+    use_eager_fetch = use_eager_fetch and len(obs_coords) > stride
+
+    # Lazy read of X. Yields (coords, (soma_data, soma_dim_0, soma_dim_1)) as numpy ndarrays
     X = query._ms.X[X_name]
     var_coords = query.var_joinids().to_numpy()
-    table_reader = (
+    var_coords_pa = pa.array(var_coords)
+    table_reader: Iterator[_COO_CHUNK] = (
         (
             (obs_coords_chunk, var_coords),
-            X.read(coords=(obs_coords_chunk, var_coords)).tables().concat(),
+            _soma_tbl_vectors(X.read(coords=(pa.array(obs_coords_chunk), var_coords_pa)).tables(), X.schema),
         )
         for obs_coords_chunk in obs_coord_chunker
     )
     if use_eager_fetch:
-        table_reader = (t for t in _EagerIterator(table_reader, query._threadpool))
+        # Keep reading ahead while earlier chunks are converted, so that a slow read does not
+        # stall the conversions queued behind it.
+        table_reader = _EagerBufferedIterator(table_reader, max_pending=2, pool=query._threadpool)
 
-    # lazy reindex of obs coordinates. Yields coords and (data, i, j) as numpy ndarrays
-    coo_reindexer = (
-        (
-            (obs_coords_chunk, var_coords),
-            (
-                tbl["soma_data"].to_numpy(),
-                pd.Index(obs_coords_chunk).get_indexer(tbl["soma_dim_0"].to_numpy()),
-                query.indexer.by_var(tbl["soma_dim_1"].to_numpy()),
-            ),
-        )
-        for (obs_coords_chunk, var_coords), tbl in table_reader
-    )
-    if use_eager_fetch:
-        coo_reindexer = (t for t in _EagerIterator(coo_reindexer, query._threadpool))
+    # Lookup table from var soma_joinid to position in var_coords, shared by all chunks. This
+    # replaces a per-chunk hash table lookup with a gather. Its size is bounded by the var domain,
+    # which is small (tens of thousands of genes in the Census).
+    var_lut = np.full(var_coords.max(initial=-1) + 1, -1, dtype=_index_dtype((0, len(var_coords)), 0))
+    var_lut[var_coords] = np.arange(len(var_coords))
 
-    # lazy convert Arrow table to Scipy sparse.csr_matrix
-    csr_reader: Generator[_RT, None, None] = (
-        (
-            (obs_coords_chunk, var_coords),
-            fmt_ctor(
-                sparse.coo_matrix(
-                    (data, (i, j)),
-                    shape=(len(obs_coords_chunk), query.n_vars),
-                )
-            ),
+    # Reindex to chunk-local positions and convert to a SciPy sparse matrix. Each chunk is
+    # independent of the others, so when eager fetching is enabled several chunks are converted
+    # concurrently in the query threadpool, overlapping with the read of the following chunks.
+    # soma_dim_0 is reindexed with a binary search of the (sorted) chunk coordinates, which
+    # avoids the construction of a hash table for each chunk, and soma_dim_1 with var_lut.
+    def chunk_to_sparse(chunk: _COO_CHUNK) -> _RT:
+        (obs_coords_chunk, var_coords), (data, soma_dim_0, soma_dim_1) = chunk
+        shape = (len(obs_coords_chunk), query.n_vars)
+        X_chunk = _reindex_coo_to_compressed(
+            fmt_ctor, data, soma_dim_0, soma_dim_1, obs_coords_chunk, var_lut, shape=shape, dtype=data_dtype
         )
-        for (obs_coords_chunk, var_coords), (data, i, j) in coo_reindexer
-    )
+        return (obs_coords_chunk, var_coords), X_chunk
+
+    csr_reader: Iterator[_RT]
     if use_eager_fetch:
-        csr_reader = (t for t in _EagerIterator(csr_reader, query._threadpool))
+        csr_reader = _EagerMapIterator(
+            chunk_to_sparse, table_reader, max_pending=min(4, os.cpu_count() or 1), pool=query._threadpool
+        )
+    else:
+        csr_reader = map(chunk_to_sparse, table_reader)
 
     yield from csr_reader
+
+
+def _soma_tbl_vectors(
+    tables: Iterator[pa.Table], schema: pa.Schema
+) -> Tuple[npt.NDArray[Any], npt.NDArray[np.int64], npt.NDArray[np.int64]]:
+    """
+    Return the soma_data, soma_dim_0 and soma_dim_1 columns of a stream of X tables as numpy
+    arrays. The arrays are preallocated and filled one Arrow chunk at a time, rather than
+    concatenating the tables first, and each table is released once copied. This avoids holding
+    a concatenated Arrow table and its numpy copy in memory at the same time.
+    """
+    tbls = deque(tables)
+    nnz = sum(tbl.num_rows for tbl in tbls)
+    vectors = tuple(np.empty(nnz, dtype=schema.field(name).type.to_pandas_dtype()) for name in _SOMA_TBL_COLUMNS)
+
+    offset = 0
+    while tbls:
+        tbl = tbls.popleft()
+        for name, vec in zip(_SOMA_TBL_COLUMNS, vectors):
+            pos = offset
+            for chunk in tbl.column(name).chunks:
+                vec[pos : pos + len(chunk)] = np.asarray(chunk)
+                pos += len(chunk)
+        offset += tbl.num_rows
+
+    data, soma_dim_0, soma_dim_1 = vectors
+    return data, soma_dim_0, soma_dim_1
+
+
+def _is_sorted(arr: npt.NDArray[Any]) -> bool:
+    return bool(np.all(arr[:-1] <= arr[1:]))
+
+
+def _index_dtype(shape: Tuple[int, int], nnz: int) -> Type[np.signedinteger[Any]]:
+    """Return the smallest index dtype able to address a sparse matrix of this shape and nnz."""
+    if max(*shape, nnz) < np.iinfo(np.int32).max:
+        return np.int32
+    return np.int64
+
+
+def _reindex_coo_to_compressed(
+    fmt_ctor: Union[Type[sparse.csr_matrix], Type[sparse.csc_matrix]],
+    data: npt.NDArray[Any],
+    soma_dim_0: npt.NDArray[np.int64],
+    soma_dim_1: npt.NDArray[np.int64],
+    obs_coords_chunk: npt.NDArray[np.int64],
+    var_lut: npt.NDArray[np.integer[Any]],
+    shape: Tuple[int, int],
+    dtype: Optional[npt.DTypeLike] = None,
+) -> sparse.spmatrix:
+    """
+    Build a csr_matrix or csc_matrix from COO vectors in soma_joinid space, reindexing them
+    as part of the conversion. Rows are reindexed by a binary search of the sorted
+    ``obs_coords_chunk``, and columns by ``var_lut``. Both layouts are built directly,
+    without an intermediate COO or CSR matrix. If ``dtype`` is specified, data is cast to it
+    as it is scattered, rather than in a separate pass.
+    """
+    csc = fmt_ctor is sparse.csc_matrix
+    n_major = shape[1] if csc else shape[0]
+    # Use int32 indices where the range permits, halving memory traffic in the conversion
+    idx_dtype = _index_dtype(shape, len(data))
+    indptr = np.empty(n_major + 1, dtype=idx_dtype)
+    indices = np.empty(len(data), dtype=idx_dtype)
+    out_data = np.empty(len(data), dtype=data.dtype if dtype is None else dtype)
+    _reindex_coo_to_compressed_inner(
+        soma_dim_0, soma_dim_1, data, obs_coords_chunk, var_lut, csc, indptr, indices, out_data
+    )
+    # Assemble the matrix from the kernel output directly. The (data, indices, indptr)
+    # constructor re-checks the index arrays, scanning them when they are int64, which
+    # is redundant as they are well formed by construction. Indices are not necessarily
+    # sorted within each row (or column), so the sorted/canonical flags are left unset.
+    X = fmt_ctor(shape, dtype=out_data.dtype)
+    X.data, X.indices, X.indptr = out_data, indices, indptr
+    return X
+
+
+@numba.jit(nopython=True, nogil=True, cache=True)  # type: ignore[misc]  # See https://github.com/numba/numba/issues/7424
+def _reindex_coo_to_compressed_inner(
+    soma_dim_0: npt.NDArray[np.int64],
+    soma_dim_1: npt.NDArray[np.int64],
+    data: npt.NDArray[Any],
+    obs_coords_chunk: npt.NDArray[np.int64],
+    var_lut: npt.NDArray[np.integer[Any]],
+    csc: bool,
+    indptr: npt.NDArray[np.integer[Any]],
+    indices: npt.NDArray[np.integer[Any]],
+    out_data: npt.NDArray[Any],
+) -> None:
+    """
+    Counting sort of the COO elements by the major axis (rows for CSR, columns for CSC),
+    reindexing each element as it is counted and scattered. The major axis is counted in
+    one pass over the elements, and the elements are scattered in a second, so the reindex,
+    cast and compressed matrix construction make two passes over nnz rather than one each.
+    The order of elements within a row (or column) is preserved.
+
+    Reindexed rows are kept from the first pass, as the binary search is the costlier of
+    the two lookups.
+
+    The scatter is not cache-blocked on the major axis. SOMA returns elements in row-major
+    order, so the CSR scatter already writes sequentially, and the CSC scatter writes to at
+    most one cursor per column. An extra bucketing pass by block of rows (or columns) costs
+    more than the cache misses it saves.
+    """
+    n_major = len(indptr) - 1
+    i = np.empty(len(soma_dim_0), dtype=indices.dtype)
+    indptr[:] = 0
+    last_dim_0 = -1
+    row = np.int64(0)
+    for k in range(len(soma_dim_0)):
+        # elements of a row are usually adjacent, so skip the search for repeated rows
+        if soma_dim_0[k] != last_dim_0:
+            last_dim_0 = soma_dim_0[k]
+            row = np.searchsorted(obs_coords_chunk, last_dim_0)
+        i[k] = row
+        major = var_lut[soma_dim_1[k]] if csc else row
+        indptr[major + 1] += 1
+    for m in range(n_major):
+        indptr[m + 1] += indptr[m]
+
+    pos = indptr[:-1].copy()
+    for k in range(len(i)):
+        col = var_lut[soma_dim_1[k]]
+        if csc:
+            major, minor = col, i[k]
+        else:
+            major, minor = i[k], col
+        p = pos[major]
+        indices[p] = minor
+        out_data[p] = data[k]
+        pos[major] = p + 1
@@ -3,11 +3,12 @@ import threading
 from collections import deque
 from concurrent import futures
 from concurrent.futures import Future
-from typing import Deque, Iterator, Optional, TypeVar
+from typing import Callable, Deque, Iterator, Optional, TypeVar
 
 util_logger = logging.getLogger("cellxgene_census.experimental.util")
 
 _T = TypeVar("_T")
+_U = TypeVar("_U")
 
 
 class _EagerIterator(Iterator[_T]):
@@ -83,15 +84,20 @@ class _EagerBufferedIterator(Iterator[_T]):
             if fut.exception() is None:
                 self._begin_next()
 
+        _future: Optional[futures.Future[_T]] = None
         with self._lock:
             not_running = len(self._pending_results) == 0 or self._pending_results[-1].done()
             if len(self._pending_results) < self.max_pending and not_running:
                 _future = self._pool.submit(self.iterator.__next__)
                 util_logger.debug("Fetching next iterator element, eagerly")
-                _future.add_done_callback(_fut_done)
                 self._pending_results.append(_future)
             assert len(self._pending_results) <= self.max_pending
 
+        # Registered outside of the lock: if the future is already done, the callback runs
+        # immediately in this thread, and re-enters _begin_next.
+        if _future is not None:
+            _future.add_done_callback(_fut_done)
+
     def _cleanup(self) -> None:
         util_logger.debug("Cleaning up eager iterator")
         if self._own_pool:
@@ -104,3 +110,85 @@ class _EagerBufferedIterator(Iterator[_T]):
         self._cleanup()
         super_del = getattr(super(), "__del__", lambda: None)
         super_del()
+
+
+class _EagerMapIterator(Iterator[_U]):
+    """
+    Apply ``fn`` to each element of ``iterator``, with up to ``max_pending`` applications
+    running concurrently in the pool. Results are returned in the order of ``iterator``.
+
+    ``iterator`` is advanced in the pool, one element at a time, and ``fn`` is applied to each
+    element as soon as it is fetched. A result is returned as soon as it is done, without
+    waiting for further elements to be fetched.
+    """
+
+    def __init__(
+        self,
+        fn: Callable[[_T], _U],
+        iterator: Iterator[_T],
+        max_pending: int = 1,
+        pool: Optional[futures.Executor] = None,
+    ):
+        super().__init__()
+        self.fn = fn
+        self.iterator = iterator
+        self.max_pending = max_pending
+        self._pool = pool or futures.ThreadPoolExecutor()
+        self._own_pool = pool is None
+        self._pending_results: Deque[futures.Future[_U]] = deque()
+        self._unfetched: Deque[futures.Future[_U]] = deque()
+        self._fetching = False
+        self._lock = threading.Lock()
+
+    def __next__(self) -> _U:
+        while len(self._pending_results) < self.max_pending:
+            result: futures.Future[_U] = futures.Future()
+            self._pending_results.append(result)
+            with self._lock:
+                self._unfetched.append(result)
+        self._fetch_next()
+
+        try:
+            return self._pending_results.popleft().result()
+        except StopIteration:
+            self._cleanup()
+            raise
+
+    def _fetch_next(self) -> None:
+        with self._lock:
+            if self._fetching or not self._unfetched:
+                return
+            self._fetching = True
+            result = self._unfetched.popleft()
+        self._pool.submit(self._fetch_and_apply, result)
+        util_logger.debug("Mapping next iterator element, eagerly")
+
+    def _fetch_and_apply(self, result: "futures.Future[_U]") -> None:
+        try:
+            item = next(self.iterator)
+        except BaseException as e:
+            result.set_exception(e)
+            return
+        finally:
+            # Start fetching the next element before applying fn to this one
+            with self._lock:
+                self._fetching = False
+            self._fetch_next()
+
+        try:
+            result.set_result(self.fn(item))
+        except BaseException as e:
+            result.set_exception(e)
+
+    def _cleanup(self) -> None:
+        util_logger.debug("Cleaning up eager map iterator")
+        if self._own_pool:
+            self._pool.shutdown()
+
+    def __del__(self) -> None:
+        # Ensure the threadpool is cleaned up in the case where the
+        # iterator is not exhausted. For more information on __del__:
+        # https://docs.python.org/3/reference/datamodel.html#object.__del__
+        self._cleanup()
+        super_del = getattr(super(), "__del__", lambda: None)
+        super_del()
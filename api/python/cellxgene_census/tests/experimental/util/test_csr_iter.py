@@ -1,10 +1,16 @@
+import pathlib
+from typing import Optional, Tuple, Type, Union
+
 import numpy as np
+import numpy.typing as npt
+import pyarrow as pa
 import pytest
 import scipy.sparse as sparse
 import tiledbsoma as soma
 
 import cellxgene_census
 from cellxgene_census.experimental.util import X_sparse_iter
+from cellxgene_census.experimental.util._csr_iter import _reindex_coo_to_compressed
 
 
 @pytest.fixture
@@ -45,3 +51,115 @@ def test_X_sparse_iter_unsupported(small_mem_context: soma.SOMATileDBContext) ->
 
             with pytest.raises(ValueError):
                 next(X_sparse_iter(query, fmt="foobar"))  # type: ignore[arg-type]
+
+
+@pytest.fixture
+def small_experiment(tmp_path: pathlib.Path) -> Tuple[str, npt.NDArray[np.float32]]:
+    """A small local experiment, with X written in several fragments. Returns its URI and dense X."""
+    rng = np.random.default_rng(0)
+    n_obs, n_vars = 1000, 300
+    X = sparse.random(n_obs, n_vars, density=0.05, format="coo", dtype=np.float32, random_state=rng)
+    # leave some rows empty, so that some chunks have no X entries at all
+    X = sparse.coo_matrix(X.multiply(rng.random((n_obs, 1)) > 0.2), dtype=np.float32)
+
+    uri = (tmp_path / "exp").as_posix()
+    with soma.Experiment.create(uri) as exp:
+        obs = exp.add_new_dataframe(
+            "obs",
+            schema=pa.schema([("soma_joinid", pa.int64()), ("label", pa.large_string())]),
+            index_column_names=["soma_joinid"],
+        )
+        obs.write(pa.Table.from_pydict({"soma_joinid": np.arange(n_obs), "label": rng.choice(["a", "b"], n_obs)}))
+        ms = exp.add_new_collection("ms").add_new_collection("RNA", soma.Measurement)
+        var = ms.add_new_dataframe(
+            "var", schema=pa.schema([("soma_joinid", pa.int64())]), index_column_names=["soma_joinid"]
+        )
+        var.write(pa.Table.from_pydict({"soma_joinid": np.arange(n_vars)}))
+        X_raw = ms.add_new_collection("X").add_new_sparse_ndarray("raw", type=pa.float32(), shape=(n_obs, n_vars))
+        perm = rng.permutation(X.nnz)
+        for frag in np.array_split(perm, 3):
+            X_raw.write(
+                pa.Table.from_pydict(
+                    {
+                        "soma_dim_0": X.row[frag].astype(np.int64),
+                        "soma_dim_1": X.col[frag].astype(np.int64),
+                        "soma_data": X.data[frag],
+                    }
+                )
+            )
+
+    return uri, X.toarray()
+
+
+@pytest.mark.experimental
+@pytest.mark.parametrize("fmt", ["csr", "csc"])
+@pytest.mark.parametrize("use_eager_fetch", [True, False])
+@pytest.mark.parametrize("stride", [3, 7, 64, 5000])
+@pytest.mark.parametrize(
+    "obs_query,var_query",
+    [
+        (None, None),
+        (soma.AxisQuery(coords=(np.array([917, 3, 512, 4, 0, 999, 64]),)), None),
+        (soma.AxisQuery(value_filter="label == 'a'"), soma.AxisQuery(coords=(np.array([299, 3, 150, 7]),))),
+    ],
+)
+def test_X_sparse_iter_local(
+    small_experiment: Tuple[str, npt.NDArray[np.float32]],
+    fmt: str,
+    use_eager_fetch: bool,
+    stride: int,
+    obs_query: Optional[soma.AxisQuery],
+    var_query: Optional[soma.AxisQuery],
+) -> None:
+    uri, X_dense = small_experiment
+    with soma.Experiment.open(uri) as exp:
+        with exp.axis_query(
+            measurement_name="RNA", obs_query=obs_query or soma.AxisQuery(), var_query=var_query or soma.AxisQuery()
+        ) as query:
+            obs_seen = []
+            for (obs_ids, var_ids), X_chunk in X_sparse_iter(
+                query, fmt=fmt, stride=stride, use_eager_fetch=use_eager_fetch  # type: ignore[arg-type]
+            ):
+                assert X_chunk.format == fmt
+                assert X_chunk.shape == (len(obs_ids), len(var_ids))
+                assert len(obs_ids) <= stride
+                X_chunk.check_format(full_check=True)
+                assert np.array_equal(X_chunk.toarray(), X_dense[np.ix_(obs_ids, var_ids)])
+                obs_seen.append(obs_ids)
+
+            assert np.array_equal(np.concatenate(obs_seen), np.sort(query.obs_joinids().to_numpy()))
+
+
+@pytest.mark.experimental
+@pytest.mark.parametrize("fmt_ctor", [sparse.csr_matrix, sparse.csc_matrix])
+@pytest.mark.parametrize("shape", [(100, 37), (1, 5), (0, 3), (7, 0), (1000, 2000)])
+@pytest.mark.parametrize("dtype", [None, np.float64, np.uint16])
+def test_reindex_coo_to_compressed(
+    fmt_ctor: Union[Type[sparse.csr_matrix], Type[sparse.csc_matrix]],
+    shape: Tuple[int, int],
+    dtype: Optional[npt.DTypeLike],
+) -> None:
+    rng = np.random.default_rng()
+    coo = sparse.random(*shape, density=0.2, format="coo", dtype=np.float32, random_state=rng)
+    coo.data = np.ceil(coo.data * 100)  # integral, like raw counts, so that all casts are exact
+    obs_coords = np.sort(rng.choice(5 * shape[0] + 1, shape[0], replace=False)).astype(np.int64)
+    var_coords = rng.choice(5 * shape[1] + 1, shape[1], replace=False).astype(np.int64)
+    var_lut = np.full(var_coords.max(initial=-1) + 1, -1, dtype=np.int32)
+    var_lut[var_coords] = np.arange(len(var_coords))
+    perm = rng.permutation(coo.nnz)  # reindexing must not depend on element order
+
+    X = _reindex_coo_to_compressed(
+        fmt_ctor,
+        coo.data[perm],
+        obs_coords[coo.row[perm]],
+        var_coords[coo.col[perm]],
+        obs_coords,
+        var_lut,
+        shape,
+        dtype,
+    )
+    assert isinstance(X, fmt_ctor)
+    assert X.shape == shape
+    assert X.dtype == (np.float32 if dtype is None else dtype)
+    X.check_format(full_check=True)
+    assert np.array_equal(X.toarray(), coo.toarray().astype(X.dtype))
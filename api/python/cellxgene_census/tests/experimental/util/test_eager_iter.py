@@ -0,0 +1,95 @@
+import threading
+from concurrent import futures
+from typing import Any, Callable, Iterator, List
+
+import pytest
+
+from cellxgene_census.experimental.util._eager_iter import _EagerBufferedIterator, _EagerMapIterator
+
+
+class _SynchronousExecutor(futures.Executor):
+    """Runs each task in submit(), so that every future is already done when returned."""
+
+    def submit(self, fn: Callable[..., Any], /, *args: Any, **kwargs: Any) -> "futures.Future[Any]":
+        fut: futures.Future[Any] = futures.Future()
+        try:
+            fut.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            fut.set_exception(e)
+        return fut
+
+
+@pytest.mark.experimental
+@pytest.mark.parametrize("max_pending", [1, 2, 3])
+def test_eager_buffered_iterator_completed_futures(max_pending: int) -> None:
+    # A read that completes before its done-callback is registered must not deadlock
+    result: List[int] = []
+
+    def consume() -> None:
+        result.extend(_EagerBufferedIterator(iter(range(10)), max_pending=max_pending, pool=_SynchronousExecutor()))
+
+    t = threading.Thread(target=consume, daemon=True)
+    t.start()
+    t.join(timeout=30)
+    assert not t.is_alive(), "_EagerBufferedIterator deadlocked"
+    assert result == list(range(10))
+
+
+@pytest.mark.experimental
+@pytest.mark.parametrize("max_pending", [1, 2, 3])
+def test_eager_buffered_iterator(max_pending: int) -> None:
+    with futures.ThreadPoolExecutor() as pool:
+        assert list(_EagerBufferedIterator(iter(range(100)), max_pending=max_pending, pool=pool)) == list(range(100))
+
+
+@pytest.mark.experimental
+@pytest.mark.parametrize("max_pending", [1, 2, 4])
+def test_eager_map_iterator(max_pending: int) -> None:
+    with futures.ThreadPoolExecutor() as pool:
+        it = _EagerMapIterator(lambda x: x * 2, iter(range(100)), max_pending=max_pending, pool=pool)
+        assert list(it) == [x * 2 for x in range(100)]
+        with pytest.raises(StopIteration):
+            next(it)
+
+
+@pytest.mark.experimental
+def test_eager_map_iterator_does_not_wait_for_source() -> None:
+    # The first result must be returned while the source is still blocked on the next element
+    unblock = threading.Event()
+
+    def source() -> Iterator[int]:
+        yield 0
+        unblock.wait()
+        yield 1
+
+    with futures.ThreadPoolExecutor() as pool:
+        it = _EagerMapIterator(lambda x: x, source(), max_pending=4, pool=pool)
+        try:
+            assert pool.submit(next, it).result(timeout=30) == 0
+        finally:
+            unblock.set()
+        assert list(it) == [1]
+
+
+@pytest.mark.experimental
+def test_eager_map_iterator_errors() -> None:
+    def source() -> Iterator[int]:
+        yield 0
+        raise ValueError("source")
+
+    def fn(x: int) -> int:
+        if x == 1:
+            raise KeyError("fn")
+        return x
+
+    with futures.ThreadPoolExecutor() as pool:
+        it = _EagerMapIterator(fn, source(), max_pending=2, pool=pool)
+        assert next(it) == 0
+        with pytest.raises(ValueError):
+            next(it)
+
+        it = _EagerMapIterator(fn, iter(range(3)), max_pending=2, pool=pool)
+        assert next(it) == 0
+        with pytest.raises(KeyError):
+            next(it)
+        assert next(it) == 2
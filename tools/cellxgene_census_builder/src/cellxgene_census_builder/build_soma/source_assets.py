@@ -1,8 +1,11 @@
 import logging
 import os
+import random
+import shutil
+import threading
 import time
 import urllib.parse
-from typing import List, Tuple, cast
+from typing import Dict, List, Tuple, cast
 
 import aiohttp
 import fsspec
@@ -10,7 +13,13 @@ import fsspec
 from ..build_state import CensusBuildArgs
 from ..util import cpu_count
 from .datasets import Dataset
-from .mp import create_process_pool_executor
+from .mp import create_thread_pool_executor
+
+HTTP_GET_TIMEOUT_SEC = 2 * 60 * 60  # just a very big timeout
+COPY_BUFFER_SIZE = 16 * 1024**2
+
+_FS_CACHE: Dict[str, fsspec.AbstractFileSystem] = {}
+_FS_CACHE_LOCK = threading.Lock()
 
 
 def stage_source_assets(datasets: List[Dataset], args: CensusBuildArgs) -> None:
@@ -24,8 +33,10 @@ def stage_source_assets(datasets: List[Dataset], args: CensusBuildArgs) -> None:
 
     N = len(datasets)
     if args.config.multi_process:
+        # Downloads are I/O bound and release the GIL, so threads suffice and avoid the
+        # cost of worker process startup and of pickling each Dataset.
         n_workers = min(max(8, cpu_count()), 256)
-        with create_process_pool_executor(args, max_workers=n_workers) as pe:
+        with create_thread_pool_executor(max_workers=n_workers) as pe:
             paths = list(
                 pe.map(copy_file, ((n, dataset, assets_dir, N) for n, dataset in enumerate(datasets, start=1)))
             )
@@ -36,13 +47,24 @@ def stage_source_assets(datasets: List[Dataset], args: CensusBuildArgs) -> None:
         datasets[i].dataset_h5ad_path = paths[i]
 
 
+def _get_filesystem(protocol: str) -> fsspec.AbstractFileSystem:
+    """
+    Return the filesystem for `protocol`, shared by all downloads so that its connection pool
+    (and credentials) are reused. fsspec's own instance cache does not help here, as its key
+    includes the calling thread, so each staging pool thread would create its own instance.
+    """
+    with _FS_CACHE_LOCK:
+        if protocol not in _FS_CACHE:
+            _FS_CACHE[protocol] = fsspec.filesystem(
+                protocol,
+                client_kwargs={"timeout": aiohttp.ClientTimeout(total=HTTP_GET_TIMEOUT_SEC, connect=None)},
+            )
+        return _FS_CACHE[protocol]
+
+
 def _copy_file(n: int, dataset: Dataset, asset_dir: str, N: int) -> str:
-    HTTP_GET_TIMEOUT_SEC = 2 * 60 * 60  # just a very big timeout
     protocol = urllib.parse.urlparse(dataset.dataset_asset_h5ad_uri).scheme
-    fs = fsspec.filesystem(
-        protocol,
-        client_kwargs={"timeout": aiohttp.ClientTimeout(total=HTTP_GET_TIMEOUT_SEC, connect=None)},
-    )
+    fs = _get_filesystem(protocol)
     dataset_file_name = f"{dataset.dataset_id}.h5ad"
     dataset_path = f"{asset_dir}/{dataset_file_name}"
 
@@ -50,14 +72,19 @@ def _copy_file(n: int, dataset: Dataset, asset_dir: str, N: int) -> str:
 
     sleep_for_secs = 10
     last_error: aiohttp.ClientPayloadError | None = None
+    start = 0
     for attempt in range(4):
         try:
-            fs.get_file(dataset.dataset_asset_h5ad_uri, dataset_path)
+            _download(fs, dataset.dataset_asset_h5ad_uri, dataset_path, start=start)
             break
         except aiohttp.ClientPayloadError as e:
             logging.error(f"Fetch of {dataset.dataset_id} at {dataset_path} failed: {str(e)}")
             last_error = e
-            time.sleep(2**attempt * sleep_for_secs)
+            # resume from the last byte written, rather than re-fetching the entire file
+            start = os.path.getsize(dataset_path) if os.path.exists(dataset_path) else 0
+            # jitter, so that concurrent failed downloads do not all retry at the same time
+            backoff_secs = 2**attempt * sleep_for_secs
+            time.sleep(backoff_secs + random.uniform(0, backoff_secs))
     else:
         assert last_error is not None
         raise last_error
@@ -70,6 +97,22 @@ def _copy_file(n: int, dataset: Dataset, asset_dir: str, N: int) -> str:
     return dataset_file_name
 
 
+def _download(fs: fsspec.AbstractFileSystem, uri: str, path: str, start: int = 0) -> None:
+    """
+    Stream `uri` to the local `path` in large blocks, rather than with `fs.get_file`, so that
+    each request and each write moves a large contiguous buffer.
+
+    If `start` is non-zero, `path` is assumed to hold the first `start` bytes of `uri` (e.g.,
+    from a failed download), and only the remainder is fetched and appended.
+    """
+    with open(path, "ab" if start else "wb", buffering=COPY_BUFFER_SIZE) as dst, fs.open(
+        uri, "rb", block_size=COPY_BUFFER_SIZE
+    ) as src:
+        if start:
+            src.seek(start)
+        shutil.copyfileobj(src, dst, length=COPY_BUFFER_SIZE)
+
+
 def copy_file(args: Tuple[int, Dataset, str, int]) -> str:
     return _copy_file(*args)
 
@@ -1,6 +1,11 @@
+import io
 import pathlib
 from types import ModuleType
+from typing import Any, List
 
+import aiohttp
+from _pytest.monkeypatch import MonkeyPatch
+from cellxgene_census_builder.build_soma import source_assets
 from cellxgene_census_builder.build_soma.datasets import Dataset
 from cellxgene_census_builder.build_soma.source_assets import stage_source_assets
 from cellxgene_census_builder.build_state import CensusBuildArgs
@@ -15,7 +20,7 @@ def test_source_assets(tmp_path: pathlib.Path, census_build_args: CensusBuildArg
     census_build_args.h5ads_path.mkdir(parents=True, exist_ok=True)
     for i in range(10):
         dataset = Dataset(f"dataset_{i}", dataset_asset_h5ad_uri=f"file://{tmp_path}/source/dataset_{i}.h5ad")
-        (tmp_path / "source" / f"dataset_{i}.h5ad").touch()
+        (tmp_path / "source" / f"dataset_{i}.h5ad").write_bytes(bytes(range(i)) * 1000)
         datasets.append(dataset)
 
     # Call the function
@@ -24,6 +29,43 @@ def test_source_assets(tmp_path: pathlib.Path, census_build_args: CensusBuildArg
     # Verify that the files exist
     for i in range(10):
         assert (census_build_args.h5ads_path / f"dataset_{i}.h5ad").exists()
+        assert (census_build_args.h5ads_path / f"dataset_{i}.h5ad").read_bytes() == bytes(range(i)) * 1000
+
+
+def test_source_assets_resumes_failed_download(
+    tmp_path: pathlib.Path, census_build_args: CensusBuildArgs, monkeypatch: MonkeyPatch
+) -> None:
+    """
+    A download which fails part way through should be resumed from the last byte written
+    """
+    content = bytes(range(256)) * 1000
+    (tmp_path / "source").mkdir()
+    (tmp_path / "source" / "dataset.h5ad").write_bytes(content)
+    census_build_args.h5ads_path.mkdir(parents=True, exist_ok=True)
+    dataset = Dataset("dataset", dataset_asset_h5ad_uri=f"file://{tmp_path}/source/dataset.h5ad")
+
+    class FlakyFile(io.BytesIO):
+        def read(self, size: int | None = -1) -> bytes:
+            if self.tell() >= len(content) // 2 and not resumed_from:
+                raise aiohttp.ClientPayloadError("connection lost")
+            return super().read(min(size or len(content), 1000))
+
+        def seek(self, offset: int, whence: int = 0) -> int:
+            resumed_from.append(offset)
+            return super().seek(offset, whence)
+
+    class FlakyFileSystem:
+        def open(self, path: str, mode: str, **kwargs: Any) -> FlakyFile:
+            return FlakyFile(content)
+
+    resumed_from: List[int] = []
+    monkeypatch.setattr(source_assets, "_get_filesystem", lambda protocol: FlakyFileSystem())
+    monkeypatch.setattr(source_assets.time, "sleep", lambda secs: None)
+
+    stage_source_assets([dataset], census_build_args)
+
+    assert resumed_from == [len(content) // 2]
+    assert (census_build_args.h5ads_path / "dataset.h5ad").read_bytes() == content
 
 
 def setup_module(module: ModuleType) -> None: